@@ -1,8 +1,15 @@
 import os
+import sys
 import json
+import atexit
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,57 +25,170 @@ else:
     logger.warning("Supabase config not found in .env!")
     supabase = None
 
+# Server-side functions from sql/functions.sql that this project has not installed.
+_missing_rpcs = set()
+
+def _rpc(name, params=None):
+    """Calls a function from sql/functions.sql. Returns None if it is not installed."""
+    if name in _missing_rpcs: return None
+    try:
+        return supabase.rpc(name, params or {}).execute().data
+    except APIError as e:
+        # PGRST202: function not found in the schema cache
+        if e.code != "PGRST202":
+            raise
+        logger.warning(f"RPC {name} not installed (see sql/functions.sql), computing client-side.")
+        _missing_rpcs.add(name)
+        return None
+
+# Rows are buffered and sent as one array insert per table (a single POST that
+# PostgREST commits atomically). A background thread flushes the buffer once
+# _FLUSH_SIZE rows are queued or _FLUSH_INTERVAL seconds after the first row
+# arrives, and every read flushes first so it sees everything logged before it.
+_FLUSH_SIZE = 100
+_FLUSH_INTERVAL = 1.0  # seconds
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="db-writer")
+_buffers = {"transactions": deque(), "portfolio_history": deque()}
+_buffer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_has_rows = threading.Event()
+_buffer_full = threading.Event()
+_flusher = None
+# Rows logged inside a transaction() block on this thread, by table.
+_local = threading.local()
+
+def _insert(table, rows):
+    try:
+        supabase.table(table).insert(rows).execute()
+    except Exception as e:
+        logger.error(f"Insert into {table} error ({len(rows)} rows): {e}")
+
+def _insert_all(batches):
+    """Inserts {table: rows} with the tables in flight at the same time."""
+    try:
+        futures = [_executor.submit(_insert, table, rows) for table, rows in batches.items()]
+    except RuntimeError:
+        # Interpreter shutdown: the pool no longer takes work, so write inline.
+        for table, rows in batches.items():
+            _insert(table, rows)
+        return
+    wait(futures)
+
+def _enqueue(table, rows):
+    global _flusher
+    staged = getattr(_local, "staged", None)
+    if staged is not None:
+        staged.setdefault(table, []).extend(rows)
+        return
+    with _buffer_lock:
+        buf = _buffers[table]
+        buf.extend(rows)
+        if len(buf) >= _FLUSH_SIZE:
+            _buffer_full.set()
+        _has_rows.set()
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="db-flusher", daemon=True)
+            _flusher.start()
+
+def _flush_loop():
+    while True:
+        _has_rows.wait()
+        _buffer_full.wait(_FLUSH_INTERVAL)
+        flush()
+
+def flush():
+    """Sends every buffered row to Supabase and waits until they are written."""
+    with _flush_lock:
+        with _buffer_lock:
+            batches = {table: list(buf) for table, buf in _buffers.items() if buf}
+            for buf in _buffers.values():
+                buf.clear()
+            _has_rows.clear()
+            _buffer_full.clear()
+        if batches:
+            _insert_all(batches)
+
+atexit.register(flush)
+
+@contextmanager
+def transaction():
+    """
+    Groups the rows logged inside the block: they are written together (one
+    insert per table, sent at the same time) when the block exits, and dropped
+    if it raises. A nested block joins the outer one.
+    """
+    if getattr(_local, "staged", None) is not None:
+        yield
+        return
+    _local.staged = staged = {}
+    try:
+        yield
+    finally:
+        _local.staged = None
+    for table, rows in staged.items():
+        _enqueue(table, rows)
+    if staged:
+        flush()
+
 def init_db():
     if not supabase: return
     try:
         # Check if portfolio_history has data
         res = supabase.table("portfolio_history").select("id").limit(1).execute()
         if not res.data:
-            # Initialize with starting balance
-            supabase.table("portfolio_history").insert({
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "total_value": 100.0
-            }).execute()
-            
-            supabase.table("transactions").insert({
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "category": 'DEPOSIT',
-                "amount": 100.0,
-                "asset": 'USD',
-                "detail": 'Initial Deposit',
-                "price": None,
-                "gain": 0.0
-            }).execute()
+            # Initialize with starting balance (both inserts in flight at once)
+            now = datetime.now(timezone.utc).isoformat()
+            _insert_all({
+                "portfolio_history": [{
+                    "timestamp": now,
+                    "total_value": 100.0
+                }],
+                "transactions": [{
+                    "timestamp": now,
+                    "category": 'DEPOSIT',
+                    "amount": 100.0,
+                    "asset": 'USD',
+                    "detail": 'Initial Deposit',
+                    "price": None,
+                    "gain": 0.0
+                }],
+            })
     except Exception as e:
         logger.error(f"DB Init Error: {e}")
 
+def log_portfolio_values_bulk(values):
+    """Queues one portfolio_history row per value; they are sent with the next flush."""
+    if not supabase or not values: return
+    # Timestamp is taken now, not at flush time, so rows keep call order.
+    now = datetime.now(timezone.utc).isoformat()
+    _enqueue("portfolio_history", [{"timestamp": now, "total_value": v} for v in values])
+
+def log_transactions_bulk(rows):
+    """
+    Queues transaction rows, each a dict with category, amount, asset, detail and
+    optionally price, gain and timestamp. They are sent with the next flush.
+    """
+    if not supabase or not rows: return
+    now = datetime.now(timezone.utc).isoformat()
+    _enqueue("transactions", [{"timestamp": now, "price": 0.0, "gain": 0.0, **row} for row in rows])
+
 def log_portfolio_value(value):
-    if not supabase: return
-    try:
-        supabase.table("portfolio_history").insert({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "total_value": value
-        }).execute()
-    except Exception as e:
-        logger.error(f"log_portfolio_value error: {e}")
+    log_portfolio_values_bulk([value])
 
 def log_transaction(category, amount, asset, detail, price=0.0, gain=0.0):
-    if not supabase: return
-    try:
-        supabase.table("transactions").insert({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "category": category,
-            "amount": amount,
-            "asset": asset,
-            "detail": detail,
-            "price": price,
-            "gain": gain
-        }).execute()
-    except Exception as e:
-        logger.error(f"log_transaction error: {e}")
+    log_transactions_bulk([{
+        "category": category,
+        "amount": amount,
+        "asset": asset,
+        "detail": detail,
+        "price": price,
+        "gain": gain
+    }])
 
 def get_portfolio_history():
     if not supabase: return []
+    flush()
     try:
         res = supabase.table("portfolio_history").select("timestamp, total_value").order("timestamp").execute()
         return [(r['timestamp'], r['total_value']) for r in res.data]
@@ -77,6 +197,7 @@ def get_portfolio_history():
 
 def get_transactions():
     if not supabase: return []
+    flush()
     try:
         res = supabase.table("transactions").select("*").order("timestamp", desc=True).limit(50).execute()
         return [(r['id'], r['timestamp'], r['category'], r['amount'], r['asset'], r['detail'], r['price'], r['gain']) for r in res.data]
@@ -85,50 +206,79 @@ def get_transactions():
 
 def get_total_deposited():
     if not supabase: return 0.0
+    flush()
     try:
+        total = _rpc("get_total_deposited")
+        if total is not None:
+            return float(total)
         res = supabase.table("transactions").select("amount").eq("category", "DEPOSIT").execute()
         return float(sum(r['amount'] or 0.0 for r in res.data))
     except Exception as e:
         return 0.0
 
+def _apply_transaction(shares, avg_price, category, amount, asset, price):
+    """
+    Folds one transaction into the parallel shares and avg_price dicts
+    (asset -> value) in place and returns its effect on the cash balance.
+    """
+    amt = float(amount or 0)
+    px = float(price or 1.0)
+    if px <= 0: px = 1.0
+
+    if category == "DEPOSIT":
+        return amt
+    elif category == "BUY":
+        if asset is None:
+            # No position to book it under (the SQL function skips these too)
+            return -amt
+        shares_bought = amt / px
+        if isinstance(asset, str):
+            # Every row carries its own copy of the name; share one object per asset.
+            asset = sys.intern(asset)
+
+        curr_shares = shares.get(asset, 0.0)
+        curr_avg = avg_price.get(asset, 0.0)
+        total_shares = curr_shares + shares_bought
+
+        new_avg = ((curr_shares * curr_avg) + (shares_bought * px)) / total_shares if total_shares > 0 else px
+        shares[asset] = total_shares
+        avg_price[asset] = new_avg
+        return -amt
+
+    elif category == "SELL":
+        shares_sold = amt / px
+        if asset in shares:
+            remaining = max(0.0, shares[asset] - shares_sold)
+            if remaining < 0.000001:
+                remaining = 0.0
+            if remaining == 0.0:
+                del shares[asset]
+                del avg_price[asset]
+            else:
+                shares[asset] = remaining
+        return amt
+    return 0.0
+
 def reconstruct_portfolio_state():
     if not supabase: return 0.0, {}
+    flush()
     try:
-        res = supabase.table("transactions").select("category, amount, asset, price").order("timestamp").execute()
-        txs = [(r['category'], r['amount'], r['asset'], r['price']) for r in res.data]
-        
-        balance = 0.0
-        portfolio = {}
-
-        for category, amount, asset, price in txs:
-            amt = float(amount or 0)
-            px = float(price or 1.0)
-            if px <= 0: px = 1.0
-
-            if category == "DEPOSIT":
-                balance += amt
-            elif category == "BUY":
-                balance -= amt
-                shares_bought = amt / px
-                if asset not in portfolio:
-                    portfolio[asset] = {'shares': 0.0, 'avg_price': 0.0}
-                
-                curr_shares = portfolio[asset]['shares']
-                curr_avg = portfolio[asset]['avg_price']
-                total_shares = curr_shares + shares_bought
-                
-                new_avg = ((curr_shares * curr_avg) + (shares_bought * px)) / total_shares if total_shares > 0 else px
-                portfolio[asset]['shares'] = total_shares
-                portfolio[asset]['avg_price'] = new_avg
-                
-            elif category == "SELL":
-                balance += amt
-                shares_sold = amt / px
-                if asset in portfolio:
-                    portfolio[asset]['shares'] = max(0.0, portfolio[asset]['shares'] - shares_sold)
-                    if portfolio[asset]['shares'] < 0.000001:
-                        del portfolio[asset]
-                        
+        result = _rpc("reconstruct_portfolio_state")
+        if result is not None:
+            positions = result['portfolio']
+            balance = float(result['balance'])
+            shares = {sys.intern(a): float(p['shares']) for a, p in positions.items()}
+            avg_price = {sys.intern(a): float(p['avg_price']) for a, p in positions.items()}
+        else:
+            res = supabase.table("transactions").select("category, amount, asset, price").order("id").execute()
+            balance, shares, avg_price = 0.0, {}, {}
+            for r in res.data:
+                balance += _apply_transaction(shares, avg_price, r['category'], r['amount'], r['asset'], r['price'])
+
+        # Callers get (and mutate) a fresh {'ASSET': {'shares', 'avg_price', 'value'}}
+        # dict, where value is the position's cost basis (shares * avg_price).
+        portfolio = {asset: {'shares': n, 'avg_price': avg_price[asset], 'value': n * avg_price[asset]}
+                     for asset, n in shares.items()}
         return balance, portfolio
     except Exception as e:
         logger.error(f"reconstruct_portfolio_state error: {e}")
@@ -136,11 +286,23 @@ def reconstruct_portfolio_state():
 
 def reset_db():
     if not supabase: return
+    flush()
     try:
-        # Supabase doesn't allow unqualified bulk deletes with REST easily, 
-        # but we can filter by id > 0 since it's identity.
-        supabase.table("transactions").delete().gt("id", -1).execute()
-        supabase.table("portfolio_history").delete().gt("id", -1).execute()
+        # One TRUNCATE (which also restarts the ids) when sql/functions.sql is installed
+        # and SUPABASE_KEY is the service_role key, the only role allowed to call it
+        try:
+            _rpc("reset_tables")
+            truncated = "reset_tables" not in _missing_rpcs
+        except APIError as e:
+            # 42501: permission denied for function
+            if e.code != "42501":
+                raise
+            truncated = False
+        if not truncated:
+            # Supabase doesn't allow unqualified bulk deletes with REST easily, 
+            # but we can filter by id > 0 since it's identity.
+            supabase.table("transactions").delete().gt("id", -1).execute()
+            supabase.table("portfolio_history").delete().gt("id", -1).execute()
         init_db()
     except Exception as e:
         logger.error(f"reset_db error: {e}")
@@ -0,0 +1,18 @@
+import json
+
+# Optional C parser for the model replies and Polymarket payloads
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+def parse_json(data):
+    """Parses a JSON str or bytes, with orjson when it is installed."""
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # The stdlib is more lenient (e.g. NaN/Infinity literals), so give it a try
+            pass
+    return json.loads(data)
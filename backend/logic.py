@@ -1,9 +1,16 @@
 import os
+import re
+import time
 import random
 import json
+import string
+import hashlib
 import logging
-from datetime import datetime, timedelta, timezone
-import yfinance as yf
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, timedelta, timezone
+from quotes import get_quotes
+from jsonutil import parse_json
 
 # Try to import google-generativeai, handle if missing
 try:
@@ -14,6 +21,165 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Expanded Universe (Top Tech + Crypto Proxies + High Volatility + Big Caps + Key Sectors)
+# Sorted once so the rotating selection in get_market_analysis is deterministic.
+STOCK_UNIVERSE = sorted(set([
+    "NVDA", "TSLA", "MSTR", "COIN", "PLTR", "AMD", "META", "GOOGL", "AMZN", "MSFT", "AAPL", 
+    "NFLX", "INTC", "SMCI", "ARM", "HOOD", "MARA", "RIOT", "CLSK", "CVNA", "UPST", "AFRM",
+    "SOFI", "PYPL", "SQ", "SHOP", "UBER", "ABNB", "CRWD", "PANW", "SNOW", "DDOG", "NET",
+    "DKNG", "RBLX", "U", "TTD", "ZS", "MDB", "TEAM", "WDAY", "ADBE", "CRM", "ORCL",
+    "IBM", "QCOM", "TXN", "AVGO", "CSCO", "GME", "AMC", "DJT",
+
+    # --- ADDITIONS: BIG CAPS & KEY SECTORS ---
+
+    # Semiconductors & Equipment
+    "ASML", "LRCX", "MU", "AMAT", "ADI", "KLAC",
+
+    # Finance & Fintech
+    "JPM", "GS", "MS", "BAC", "V", "MA", "AXP", "BLK",
+
+    # Healthcare & Biotech
+    "LLY", "NVO", "UNH", "PFE", "ABBV", "MRK", "AMGN", "TMO",
+
+    # Consumption & Retail
+    "WMT", "COST", "TGT", "NKE", "SBUX", "EL", "LULU",
+
+    # Energy & Industry
+    "XOM", "CVX", "GE", "CAT", "DE", "BA", "HON",
+
+    # Auto & Transport
+    "F", "GM", "RIVN", "FDX", "UPS",
+
+    # Tech / Cloud / Cybersecurity
+    "NOW", "ESTC", "OKTA", "FTNT", "MNTY", "ANET", "APP", "MELI"
+]))
+
+STOCKS_PER_ROUND = 20
+STOCK_ROTATION_SECONDS = 300  # how long one window of the universe stays selected
+
+# Decision prompt. The strategy rules are static; only the $placeholders are
+# filled per call (literal dollar signs are written as $$).
+PROMPT_TEMPLATE = string.Template("""
+Act as a High-Stakes Speculator and Venture Trader.
+Your goal is active trading on SHORT TERM prediction markets to compound gains quickly.
+Current Date: $today_date
+
+**MARKET STATUS**:
+- US Stocks: $stock_status
+- Crypto/Polymarket: OPEN 24/7
+
+$restriction_note
+
+Financial Overview:
+- Total Capital: $$${total_capital}
+- Cash Balance: $$${current_balance} (${cash_percentage}% of capital)
+- Invested Capital: $$${invested_capital}
+
+Current Portfolio Listings:
+$portfolio_str
+
+Market Sentiment: $sentiment
+
+$market_context_str
+
+Analyze the market conditions. Look for "Underdogs" or "High Volatility" plays.
+Decide on ONE action: BUY, SELL, HOLD, or WATCH.
+
+
+MANDATORY STRATEGY & RULES:
+
+**1. POLYMARKET STRATEGY (Binary / Expiry Focus)**:
+   - **Core Rule**: ONLY BUY if "days left" is <= 7.
+   - **Goal**: Snipe mispriced binary events near expiry.
+   - **Constraint**: Max price $$0.75 (seek asymmetry).
+   - **Naming**: `POLY:<slug>:<OUTCOME_NAME>`
+
+**2. STOCKS & CRYPTO STRATEGY (Day Trader / Scalper)**:
+   - **Mindset**: High Frequency Swing Trader.
+   - **Tactics**: 
+     - **Dip Buying**: If Day Change is Negative (e.g. -2%), BUY to catch the rebound.
+     - **Momentum**: If Day Change is strong (+3%), BUY to ride the wave.
+   - **Returns**: Target small consistent gains (2-5%). Do not wait for 100% returns.
+   - **Activity**: Trade frequently. Do not sit on cash.
+   - **Naming**: Use Ticker (e.g., `NVDA`, `BTC-USD`).
+   
+**3. Capital Allocation**: 
+   - **Target**: 80% Invested / 20% Cash.
+   - If Cash > 50%: **AGGRESSIVELY BUY** top stocks/crypto immediately.
+   
+**4. Execution**:
+   - **Price**: You MUST use the exact price listed in the context.
+   - **Size**: Trade in DOLLAR AMOUNTS (e.g. $$50, $$100). Do NOT output share counts.
+
+Strictly output valid JSON with keys: 
+- "action": (BUY/SELL/HOLD/WATCH)
+- "asset": (String meeting the Naming criteria above)
+- "amount": (float - IN USD DOLLARS. Example: 150.0 means $$150.00. Do NOT output number of shares.)
+- "price": (float, current market price)
+- "reasoning": (short punchy explanation, max 15 words)
+""")
+
+# Body of a ``` or ```json fenced block; an unclosed fence runs to the end of the text.
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|\Z)", re.S)
+
+def _days_left_labels(deadlines, today):
+    """
+    Returns a "(N days left)" style label per deadline string.
+    Unknown or malformed deadlines get an empty label.
+    """
+    labels = []
+    for deadline in deadlines:
+        try:
+            days = (date.fromisoformat(str(deadline)[:10]) - today).days
+        except ValueError:
+            labels.append("")
+            continue
+        if days < 0:
+            labels.append("(Expired)")
+        elif days == 0:
+            labels.append("(Expiring Today)")
+        else:
+            labels.append(f"({days} days left)")
+    return labels
+
+# genai.list_models() is a network round-trip and its answer rarely changes, so it
+# is cached per API key for MODEL_LIST_TTL seconds, in memory and on disk.
+MODEL_LIST_TTL = 3600
+MODEL_LIST_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "predictai", "models.json")
+_model_list_cache = {"key": None, "t": 0.0, "names": None}
+_model_list_lock = threading.Lock()
+
+# Model fallback hedging: start the next model after this many seconds without an
+# answer, with at most MAX_MODELS_IN_FLIGHT requests running at once.
+MODEL_HEDGE_DELAY = 2.0
+MAX_MODELS_IN_FLIGHT = 2
+
+def _list_available_models(api_key):
+    key_id = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    with _model_list_lock:
+        now = time.time()
+        cached = _model_list_cache
+        if cached["key"] != key_id or now - cached["t"] >= MODEL_LIST_TTL:
+            try:
+                with open(MODEL_LIST_CACHE_PATH) as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = {"key": None, "t": 0.0, "names": None}
+
+        if cached.get("key") == key_id and now - cached.get("t", 0.0) < MODEL_LIST_TTL:
+            _model_list_cache.update(cached)
+            return cached["names"]
+
+        names = [m.name for m in genai.list_models()]
+        _model_list_cache.update(key=key_id, t=now, names=names)
+        try:
+            os.makedirs(os.path.dirname(MODEL_LIST_CACHE_PATH), exist_ok=True)
+            with open(MODEL_LIST_CACHE_PATH, "w") as f:
+                json.dump(_model_list_cache, f)
+        except OSError as e:
+            logger.warning(f"Could not persist model list cache: {e}")
+        return names
+
 class DecisionEngine:
     def __init__(self, api_key=None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
@@ -42,8 +208,8 @@ class DecisionEngine:
     def _init_valid_models(self, preferred):
         """Filter preferred models against what is actually available via API"""
         try:
-            # Get list of available models from API
-            available_models = [m.name for m in genai.list_models()]
+            # Get list of available models from API (cached, see _list_available_models)
+            available_models = _list_available_models(self.api_key)
             # logger.info(f"Available Gemini Models: {available_models}") 
             
             valid = []
@@ -61,17 +227,32 @@ class DecisionEngine:
             logger.error(f"Failed to list models: {e}. Using default list.")
             return preferred
 
+    def _generate_text(self, model_name, context):
+        """
+        Streams a single-turn response and stops reading once a complete ``` fenced
+        block has arrived, so trailing commentary after the JSON is never waited for.
+        """
+        model = genai.GenerativeModel(model_name)
+        parts = []
+        fences = 0
+        for chunk in model.generate_content(context, stream=True):
+            parts.append(chunk.text)
+            # A fence split across two chunks is missed here; we then just read to the end.
+            fences += chunk.text.count("```")
+            if fences >= 2:
+                break
+        return "".join(parts)
+
     def _is_market_open(self):
         """Check if US Market is open (Mon-Fri 14:30-21:00 UTC)."""
         now = datetime.now(timezone.utc)
-        if now.weekday() >= 5: return False # Weekend
-        # Simple UTC check for 9:30 ET - 16:00 ET (Roughly 13:30/14:30 to 20:00/21:00 UTC)
-        minutes = now.hour * 60 + now.minute
-        return 810 <= minutes <= 1260
+        # Weekday check plus a simple UTC window for 9:30 ET - 16:00 ET (Roughly 13:30/14:30 to 20:00/21:00 UTC)
+        return now.weekday() < 5 and 810 <= now.hour * 60 + now.minute <= 1260
 
-    def get_market_analysis(self, current_balance, portfolio, preferences=None):
+    def get_market_analysis(self, current_balance, portfolio, preferences=None, invested_capital=None):
         """
         Generates an investment decision (BUY/SELL/HOLD) based on market data.
+        invested_capital (cost basis of the portfolio) is summed from portfolio if not given.
         """
         # Handle Preferences
         if preferences is None:
@@ -91,247 +272,181 @@ class DecisionEngine:
         # Format Market Data
         
         real_markets = [] 
-        market_context_str = f"Today's Date: {today_date}\n"
+        # Collected as fragments and joined once below
+        context_parts = [f"Today's Date: {today_date}\n"]
         
         # 1. POLYMARKET
         if preferences.get("polymarket", True):
             from polymarket import get_top_markets
             real_markets = get_top_markets(limit=20)
             
-            market_context_str += "\nREAL-TIME POLYMARKET PRICES (Title | Prices | Deadline | Slug):\n"
-            today_date_obj = datetime.now().date()
-            for m in real_markets:
-                 deadline = m.get('deadline', 'Unknown')
-                 
-                 days_left_str = ""
-                 try:
-                     if deadline != 'Unknown':
-                         d_str = deadline.split('T')[0]
-                         target_date = datetime.strptime(d_str, "%Y-%m-%d").date()
-                         days = (target_date - today_date_obj).days
-                         
-                         if days < 0:
-                             days_left_str = "(Expired)"
-                         elif days == 0:
-                             days_left_str = "(Expiring Today)"
-                         else:
-                             days_left_str = f"({days} days left)"
-                 except:
-                     pass
-
-                 market_context_str += f"- {m['title']} | {m['prices']} | Ends: {deadline} {days_left_str} | POLY:{m['slug']}\n"
+            context_parts.append("\nREAL-TIME POLYMARKET PRICES (Title | Prices | Deadline | Slug):\n")
+            deadlines = [m.get('deadline', 'Unknown') for m in real_markets]
+            days_left = _days_left_labels(deadlines, datetime.now().date())
+            for m, deadline, days_left_str in zip(real_markets, deadlines, days_left):
+                 context_parts.append(f"- {m['title']} | {m['prices']} | Ends: {deadline} {days_left_str} | POLY:{m['slug']}\n")
         else:
-            market_context_str += "Polymarket Trading: DISABLED (Do not buy Polymarket assets).\n"
+            context_parts.append("Polymarket Trading: DISABLED (Do not buy Polymarket assets).\n")
 
         # 2. CRYPTO
         if preferences.get("crypto", True):
             try:
                 cryptos = ["BTC-USD", "ETH-USD", "SOL-USD", "DOGE-USD", "XRP-USD"]
-                market_context_str += "\nREAL-TIME CRYPTO PRICES (Ticker | Price | 24h Change):\n"
-                # Fetch data
-                tickers = yf.Tickers(" ".join(cryptos))
+                context_parts.append("\nREAL-TIME CRYPTO PRICES (Ticker | Price | 24h Change):\n")
+                # Fetch data (one batched download)
+                quotes = get_quotes(cryptos)
                 for symbol in cryptos:
-                    try:
-                        info = tickers.tickers[symbol].fast_info
-                        price = info.last_price
-                        prev_close = info.previous_close
-                        change_percent = ((price - prev_close) / prev_close) * 100 if prev_close else 0.0
-                        market_context_str += f"- {symbol} | ${price:.2f} | 24h Change: {change_percent:+.2f}% | Ticker: {symbol}\n"
-                    except:
-                        pass
+                    if symbol not in quotes:
+                        continue
+                    price, prev_close = quotes[symbol]
+                    change_percent = ((price - prev_close) / prev_close) * 100 if prev_close else 0.0
+                    context_parts.append(f"- {symbol} | ${price:.2f} | 24h Change: {change_percent:+.2f}% | Ticker: {symbol}\n")
             except Exception as e:
                 logger.error(f"Error fetching crypto: {e}")
         else:
-             market_context_str += "Crypto Trading: DISABLED.\n"
+             context_parts.append("Crypto Trading: DISABLED.\n")
 
         # 3. STOCKS (Real Market Hours Only)
         if preferences.get("stocks", True):
             if market_open:
                 try:
-                    # Expanded Universe (Top Tech + Crypto Proxies + High Volatility + Big Caps + Key Sectors)
-                    stock_universe = [
-                        "NVDA", "TSLA", "MSTR", "COIN", "PLTR", "AMD", "META", "GOOGL", "AMZN", "MSFT", "AAPL", 
-                        "NFLX", "INTC", "SMCI", "ARM", "HOOD", "MARA", "RIOT", "CLSK", "CVNA", "UPST", "AFRM",
-                        "SOFI", "PYPL", "SQ", "SHOP", "UBER", "ABNB", "CRWD", "PANW", "SNOW", "DDOG", "NET",
-                        "DKNG", "RBLX", "U", "TTD", "ZS", "MDB", "TEAM", "WDAY", "ADBE", "CRM", "ORCL",
-                        "IBM", "QCOM", "TXN", "AVGO", "CSCO", "GME", "AMC", "DJT",
-                        
-                        # --- ADDITIONS: BIG CAPS & KEY SECTORS ---
-                        
-                        # Semiconductors & Equipment
-                        "ASML", "LRCX", "MU", "AMAT", "ADI", "KLAC",
-                        
-                        # Finance & Fintech
-                        "JPM", "GS", "MS", "BAC", "V", "MA", "AXP", "BLK",
-                        
-                        # Healthcare & Biotech
-                        "LLY", "NVO", "UNH", "PFE", "ABBV", "MRK", "AMGN", "TMO",
-                        
-                        # Consumption & Retail
-                        "WMT", "COST", "TGT", "NKE", "SBUX", "EL", "LULU",
-                        
-                        # Energy & Industry
-                        "XOM", "CVX", "GE", "CAT", "DE", "BA", "HON",
-                        
-                        # Auto & Transport
-                        "F", "GM", "RIVN", "FDX", "UPS",
-                        
-                        # Tech / Cloud / Cybersecurity
-                        "NOW", "ESTC", "OKTA", "FTNT", "MNTY", "ANET", "APP", "MELI"
-                    ]
-                    
-                    # Randomly select 20 tickers to analyze this round to keep context manageable
+                    # Analyze a rotating window of 20 tickers per round to keep context manageable.
+                    # The window only moves every STOCK_ROTATION_SECONDS, so repeated calls ask
+                    # for the same symbols and hit the quote cache.
                     # Always include current portfolio holdings to ensure we track them
-                    holdings = [k for k in portfolio.keys() if "POLY" not in k and "-" not in k and k in stock_universe]
-                    pool = list(set(stock_universe) - set(holdings))
-                    selected_stocks = holdings + random.sample(pool, min(len(pool), 20 - len(holdings)))
+                    holdings = [k for k in portfolio.keys() if "POLY" not in k and "-" not in k and k in STOCK_UNIVERSE]
+                    pool = [s for s in STOCK_UNIVERSE if s not in holdings]
+                    window = max(0, STOCKS_PER_ROUND - len(holdings))
+                    selected_stocks = list(holdings)
+                    if pool and window:
+                        bucket = int(time.time() // STOCK_ROTATION_SECONDS)
+                        # Step by the window width so consecutive windows tile the whole pool
+                        start = (bucket * window) % len(pool)
+                        selected_stocks += (pool[start:] + pool[:start])[:window]
                     
-                    market_context_str += "\nREAL-TIME STOCK PRICES (Ticker | Price | Day Change):\n"
-                    tickers = yf.Tickers(" ".join(selected_stocks))
+                    context_parts.append("\nREAL-TIME STOCK PRICES (Ticker | Price | Day Change):\n")
+                    quotes = get_quotes(selected_stocks)
                     
                     for symbol in selected_stocks:
-                        try:
-                            info = tickers.tickers[symbol].fast_info
-                            price = info.last_price
-                            prev_close = info.previous_close
-                            change_percent = ((price - prev_close) / prev_close) * 100 if prev_close else 0.0
-                            
-                            indicator = "(DIP BUY OPP)" if change_percent < -1.5 else "(MOMENTUM)" if change_percent > 1.5 else "(Choppy)"
-                            market_context_str += f"- {symbol} | ${price:.2f} | Day Change: {change_percent:+.2f}% {indicator} | Ticker: {symbol}\n"
-                        except:
-                            pass
+                        if symbol not in quotes:
+                            continue
+                        price, prev_close = quotes[symbol]
+                        change_percent = ((price - prev_close) / prev_close) * 100 if prev_close else 0.0
+                        
+                        indicator = "(DIP BUY OPP)" if change_percent < -1.5 else "(MOMENTUM)" if change_percent > 1.5 else "(Choppy)"
+                        context_parts.append(f"- {symbol} | ${price:.2f} | Day Change: {change_percent:+.2f}% {indicator} | Ticker: {symbol}\n")
                 except Exception as e:
                     logger.error(f"Error fetching stocks: {e}")
             else:
-                market_context_str += "\nStock Market: CLOSED (Trading Halted). Do NOT trade stocks.\n"
+                context_parts.append("\nStock Market: CLOSED (Trading Halted). Do NOT trade stocks.\n")
         else:
-             market_context_str += "Stock Trading: DISABLED.\n"
+             context_parts.append("Stock Trading: DISABLED.\n")
+        
+        market_context_str = "".join(context_parts)
         
         # Format Portfolio Data (Holdings)
-        portfolio_str = ""
         if portfolio:
-            for asset, details in portfolio.items():
-                portfolio_str += f"- {asset}: {details['shares']:.2f} shares @ Avg Price ${details['avg_price']:.2f}\n"
+            portfolio_str = "".join(
+                f"- {asset}: {details['shares']:.2f} shares @ Avg Price ${details['avg_price']:.2f}\n"
+                for asset, details in portfolio.items()
+            )
         else:
             portfolio_str = "None (All Cash)"
 
         # Calculate financial state
-        invested_capital = sum(v['shares'] * v['avg_price'] for v in portfolio.values()) if portfolio else 0
+        if invested_capital is None:
+            invested_capital = sum(v['shares'] * v['avg_price'] for v in portfolio.values()) if portfolio else 0
         total_capital = current_balance + invested_capital
         cash_percentage = (current_balance / total_capital * 100) if total_capital > 0 else 0
         
-        context = f"""
-        Act as a High-Stakes Speculator and Venture Trader.
-        Your goal is active trading on SHORT TERM prediction markets to compound gains quickly.
-        Current Date: {today_date}
-        
-        **MARKET STATUS**:
-        - US Stocks: {"OPEN" if market_open else "CLOSED (Do NOT trade Stocks)"}
-        - Crypto/Polymarket: OPEN 24/7
-        
-        {restriction_note}
-        
-        Financial Overview:
-        - Total Capital: ${total_capital:.2f}
-        - Cash Balance: ${current_balance:.2f} ({cash_percentage:.1f}% of capital)
-        - Invested Capital: ${invested_capital:.2f}
-        
-        Current Portfolio Listings:\n{portfolio_str}
-        
-        Market Sentiment: {sentiment}
-        
-        {market_context_str}
-        
-        Analyze the market conditions. Look for "Underdogs" or "High Volatility" plays.
-        Decide on ONE action: BUY, SELL, HOLD, or WATCH.
-        
-        
-        MANDATORY STRATEGY & RULES:
-        
-        **1. POLYMARKET STRATEGY (Binary / Expiry Focus)**:
-           - **Core Rule**: ONLY BUY if "days left" is <= 7.
-           - **Goal**: Snipe mispriced binary events near expiry.
-           - **Constraint**: Max price $0.75 (seek asymmetry).
-           - **Naming**: `POLY:<slug>:<OUTCOME_NAME>`
-        
-        **2. STOCKS & CRYPTO STRATEGY (Day Trader / Scalper)**:
-           - **Mindset**: High Frequency Swing Trader.
-           - **Tactics**: 
-             - **Dip Buying**: If Day Change is Negative (e.g. -2%), BUY to catch the rebound.
-             - **Momentum**: If Day Change is strong (+3%), BUY to ride the wave.
-           - **Returns**: Target small consistent gains (2-5%). Do not wait for 100% returns.
-           - **Activity**: Trade frequently. Do not sit on cash.
-           - **Naming**: Use Ticker (e.g., `NVDA`, `BTC-USD`).
-           
-        **3. Capital Allocation**: 
-           - **Target**: 80% Invested / 20% Cash.
-           - If Cash > 50%: **AGGRESSIVELY BUY** top stocks/crypto immediately.
-           
-        **4. Execution**:
-           - **Price**: You MUST use the exact price listed in the context.
-           - **Size**: Trade in DOLLAR AMOUNTS (e.g. $50, $100). Do NOT output share counts.
-        
-        Strictly output valid JSON with keys: 
-        - "action": (BUY/SELL/HOLD/WATCH)
-        - "asset": (String meeting the Naming criteria above)
-        - "amount": (float - IN USD DOLLARS. Example: 150.0 means $150.00. Do NOT output number of shares.)
-        - "price": (float, current market price)
-        - "reasoning": (short punchy explanation, max 15 words)
-        """
+        context = PROMPT_TEMPLATE.substitute(
+            today_date=today_date,
+            stock_status="OPEN" if market_open else "CLOSED (Do NOT trade Stocks)",
+            restriction_note=restriction_note,
+            total_capital=f"{total_capital:.2f}",
+            current_balance=f"{current_balance:.2f}",
+            cash_percentage=f"{cash_percentage:.1f}",
+            invested_capital=f"{invested_capital:.2f}",
+            portfolio_str=portfolio_str,
+            sentiment=sentiment,
+            market_context_str=market_context_str,
+        )
         
         if not self.valid_models:
             return self._simulate_decision()
             
-        # Try models in sequence (Fallback logic)
-        for model_name in self.valid_models:
-            try:
-                # logger.info(f"Using Gemini Model: {model_name}")
-                model = genai.GenerativeModel(model_name)
-                chat = model.start_chat(history=[])
-                response = chat.send_message(context)
-                
-                cleaned_text = response.text.strip()
-                if "```json" in cleaned_text:
-                    cleaned_text = cleaned_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in cleaned_text:
-                    cleaned_text = cleaned_text.split("```")[1].split("```")[0].strip()
-                    
-                decision = json.loads(cleaned_text)
-                
-                # --- HARD GUARDRAILS ---
-                # Enforce Max Buy Price of $0.75 ONLY for Polymarket/Prediction assets
-                # We allow Stocks/Crypto (e.g. NVDA at $140) to pass through.
-                if decision.get("action") == "BUY":
-                    asset_name = str(decision.get("asset", ""))
+        # Try models in preference order (Fallback logic), hedged: if the newest
+        # request has not answered after MODEL_HEDGE_DELAY seconds the next model is
+        # started alongside it, and the first valid decision wins.
+        pending_models = list(self.valid_models)
+        in_flight = {}
+        executor = ThreadPoolExecutor(max_workers=MAX_MODELS_IN_FLIGHT, thread_name_prefix="gemini")
+
+        def launch_next():
+            model_name = pending_models.pop(0)
+            in_flight[executor.submit(self._query_model, model_name, context)] = model_name
+
+        try:
+            launch_next()
+            while in_flight:
+                can_hedge = pending_models and len(in_flight) < MAX_MODELS_IN_FLIGHT
+                done, _ = wait(in_flight, timeout=MODEL_HEDGE_DELAY if can_hedge else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    model_name = in_flight.pop(future)
                     try:
-                        price = float(decision.get("price", 0))
-                        
-                        # Only apply limitation to Polymarket assets or low-value binary options
-                        # If price is > 1.0, it's likely a stock/crypto, so we ALLOW it.
-                        is_prediction_market = asset_name.startswith("POLY:") or price < 0.99
-                        
-                        if is_prediction_market and price > 0.75:
-                            logger.warning(f"BLOCKED BUY: AI tried to buy prediction asset {asset_name} at ${price}. Limit is $0.75.")
-                            decision = {
-                                "action": "HOLD",
-                                "asset": asset_name,
-                                "amount": 0,
-                                "price": price,
-                                "reasoning": f"BLOCKED: Price ${price} is too high (> $0.75) for prediction markets."
-                            }
-                    except:
-                        pass
-                
-                # If successful, return immediately
-                return decision
-                
-            except Exception as e:
-                logger.warning(f"Model {model_name} failed: {e}. Switching to next model...")
-                continue
+                        # If successful, return immediately
+                        return self._apply_guardrails(future.result())
+                    except Exception as e:
+                        logger.warning(f"Model {model_name} failed: {e}. Switching to next model...")
+
+                # Hedge timeout or a failed model: start the next one in line
+                if pending_models and len(in_flight) < MAX_MODELS_IN_FLIGHT:
+                    launch_next()
+        finally:
+            # Don't wait for slower requests still running; their answers are ignored.
+            executor.shutdown(wait=False, cancel_futures=True)
         
         # If all models fail
         return {"action": "HOLD", "reasoning": "All models unavailable (Quota/Error)"}
 
+    def _query_model(self, model_name, context):
+        """Asks one model for a decision and returns the parsed JSON (raises on failure)."""
+        # logger.info(f"Using Gemini Model: {model_name}")
+        cleaned_text = self._generate_text(model_name, context).strip()
+        # Take the body of the first ``` / ```json fenced block, if there is one
+        fenced = _FENCE_RE.search(cleaned_text)
+        if fenced:
+            cleaned_text = fenced.group(1)
+            
+        return parse_json(cleaned_text)
+
+    def _apply_guardrails(self, decision):
+        # --- HARD GUARDRAILS ---
+        # Enforce Max Buy Price of $0.75 ONLY for Polymarket/Prediction assets
+        # We allow Stocks/Crypto (e.g. NVDA at $140) to pass through.
+        if decision.get("action") == "BUY":
+            asset_name = str(decision.get("asset", ""))
+            try:
+                price = float(decision.get("price", 0))
+                
+                # Only apply limitation to Polymarket assets or low-value binary options
+                # If price is > 1.0, it's likely a stock/crypto, so we ALLOW it.
+                is_prediction_market = asset_name.startswith("POLY:") or price < 0.99
+                
+                if is_prediction_market and price > 0.75:
+                    logger.warning(f"BLOCKED BUY: AI tried to buy prediction asset {asset_name} at ${price}. Limit is $0.75.")
+                    decision = {
+                        "action": "HOLD",
+                        "asset": asset_name,
+                        "amount": 0,
+                        "price": price,
+                        "reasoning": f"BLOCKED: Price ${price} is too high (> $0.75) for prediction markets."
+                    }
+            except:
+                pass
+        return decision
+
     def _simulate_decision(self):
         """Fallback simulation if no API key or error - Tries to use REAL Polymarket data first"""
         actions = ['BUY', 'HOLD', 'SELL', 'WATCH']
@@ -1,8 +1,10 @@
 from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
-import schedule
 import time
+import asyncio
+import random
 import threading
 import logging
 from datetime import datetime
@@ -10,7 +12,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from db import init_db, log_portfolio_value, log_transaction, get_transactions, get_portfolio_history, reconstruct_portfolio_state, reset_db, get_total_deposited
+from db import init_db, log_portfolio_value, log_transaction, get_transactions, get_portfolio_history, reconstruct_portfolio_state, reset_db, get_total_deposited, transaction
 from logic import DecisionEngine
 
 # Configure logging
@@ -31,6 +33,29 @@ app.add_middleware(
 # Global state (simulated current balance)
 current_balance = 100.0  # Default, overwritten by DB
 portfolio = {}  # Default, overwritten by DB
+# Sum of shares * avg_price over portfolio, kept up to date on every BUY and SELL
+_total_cost_basis = 0.0
+# Sum of all deposits; None until /api/status first loads it. Only
+# deposit_funds changes it, and a reset drops it. Every change bumps
+# _deposits_generation, so a load that was already running when the
+# total changed is not stored over it.
+_total_deposited_cache = None
+_deposits_generation = 0
+_deposits_lock = threading.Lock()
+
+def _update_total_deposited(amount=None):
+    """Adds a deposit to the cached total, or drops the total when amount is None."""
+    global _total_deposited_cache, _deposits_generation
+    with _deposits_lock:
+        _deposits_generation += 1
+        if amount is None or _total_deposited_cache is None:
+            _total_deposited_cache = None
+        else:
+            _total_deposited_cache += amount
+# Last value written to portfolio_history. Scheduled runs skip the write
+# when the value moved less than HISTORY_MIN_CHANGE (relative) since then.
+_last_logged_value = None
+HISTORY_MIN_CHANGE = 0.005
 trading_preferences = {
     "stocks": True,
     "crypto": True, 
@@ -43,42 +68,69 @@ def setup():
     init_db()
     
     # Load state from database to persist across restarts
-    global current_balance, portfolio
+    global current_balance, portfolio, _total_cost_basis, _last_logged_value
+    _update_total_deposited(None)
     c_bal, port = reconstruct_portfolio_state()
     # If DB was just initialized with 100 DEPOSIT, reconstruct_portfolio_state returns 100.
     # If DB was empty (fresh install), init_db adds 100 DEPOSIT, then reconstruct returns 100.
     # So we can safely trust reconstruct_portfolio_state.
     current_balance = c_bal
     portfolio = port
+    _total_cost_basis = sum(v['value'] for v in portfolio.values())
     
     logger.info(f"System State Loaded: Balance=${current_balance}, Portfolio={portfolio}")
 
     # Log current state immediately so chart is up to date
-    # Fix: portfolio values are dicts now
-    total_holdings = sum(v['shares'] * v['avg_price'] for v in portfolio.values())
-    total_val = current_balance + total_holdings
+    total_val = current_balance + _total_cost_basis
     log_portfolio_value(total_val)
+    _last_logged_value = total_val
+
+    # First scheduled run in 5 minutes
+    _schedule_next_run()
 
-    # Start the scheduler in a background thread
-    threading.Thread(target=run_scheduler, daemon=True).start()
+# Seconds between scheduled investment runs
+INVESTMENT_INTERVAL = 300
 
-def run_scheduler():
-    """Runs the investment logic every 5 minutes."""
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+# Held while a run trades, so the timer and /api/run never overlap; a run
+# that finds it taken is skipped rather than queued
+_job_lock = threading.Lock()
+
+def _schedule_next_run():
+    timer = threading.Timer(INVESTMENT_INTERVAL, _run_scheduled_job)
+    timer.daemon = True
+    timer.start()
+
+def _run_scheduled_job():
+    """Runs the investment logic, then schedules the next run 5 minutes after it finishes."""
+    try:
+        investment_job()
+    except Exception as e:
+        logger.error(f"Scheduled investment run failed: {e}")
+    finally:
+        _schedule_next_run()
 
 def investment_job():
-    global current_balance, portfolio, trading_preferences
+    if not _job_lock.acquire(blocking=False):
+        logger.warning("Investment analysis already running, skipping this run.")
+        return
+    try:
+        _investment_turn()
+    finally:
+        _invalidate_caches()
+        _job_lock.release()
+
+def _investment_turn():
+    global current_balance, portfolio, trading_preferences, _total_cost_basis, _last_logged_value
     logger.info("Running scheduled investment analysis...")
     
     # Estimate current portfolio value dict for Gemini
-    # portfolio structure: {'ASSET': {'shares': 10, 'avg_price': 0.5}}
-    total_invested = sum(v['shares'] * v['avg_price'] for v in portfolio.values())
+    # portfolio structure: {'ASSET': {'shares': 10, 'avg_price': 0.5, 'value': 5.0}}
+    # where 'value' (cost basis, shares * avg_price) is updated with every trade
+    total_invested = _total_cost_basis
     total_portfolio_value = current_balance + total_invested
     
     engine = DecisionEngine()
-    decision = engine.get_market_analysis(current_balance, portfolio, trading_preferences)
+    decision = engine.get_market_analysis(current_balance, portfolio, trading_preferences, invested_capital=total_invested)
     
     action = decision.get("action")
     asset = decision.get("asset")
@@ -88,113 +140,147 @@ def investment_job():
     
     gain = 0.0
 
-    if action == "BUY":
-        # DIVERSIFICATION GUARDRAIL: Max 40% in one asset
-        current_asset_val = 0.0
-        if asset in portfolio:
-            current_asset_val = portfolio[asset]['shares'] * portfolio[asset]['avg_price']
+    # The turn's transaction and the portfolio value are written together
+    with transaction():
+        if action == "BUY":
+            # DIVERSIFICATION GUARDRAIL: Max 40% in one asset
+            current_asset_val = 0.0
+            if asset in portfolio:
+                current_asset_val = portfolio[asset]['value']
             
-        max_position_size = total_portfolio_value * 0.40
-        proposed_total = current_asset_val + amount
+            max_position_size = total_portfolio_value * 0.40
+            proposed_total = current_asset_val + amount
         
-        if proposed_total > max_position_size:
-            allowed_buy = max_position_size - current_asset_val
-            if allowed_buy < 2.0: # If less than $2 room left, just block it
-                logger.warning(f"Blocked BUY {asset}: Position limit reached ({current_asset_val:.2f} / {max_position_size:.2f})")
-                log_transaction("WATCH", 0, asset, "Diversification limit reached (Max 40%)", price, 0.0)
-                return # Skip this turn
-            else:
-                logger.info(f"Capping BUY {asset} from ${amount} to ${allowed_buy:.2f} (Diversification Rule)")
-                amount = allowed_buy
+            if proposed_total > max_position_size:
+                allowed_buy = max_position_size - current_asset_val
+                if allowed_buy < 2.0: # If less than $2 room left, just block it
+                    logger.warning(f"Blocked BUY {asset}: Position limit reached ({current_asset_val:.2f} / {max_position_size:.2f})")
+                    log_transaction("WATCH", 0, asset, "Diversification limit reached (Max 40%)", price, 0.0)
+                    return # Skip this turn
+                else:
+                    logger.info(f"Capping BUY {asset} from ${amount} to ${allowed_buy:.2f} (Diversification Rule)")
+                    amount = allowed_buy
 
-        if current_balance >= amount and amount > 0:
-            current_balance -= amount
-            shares_bought = amount / price
+            if current_balance >= amount and amount > 0:
+                current_balance -= amount
+                _total_cost_basis += amount
+                shares_bought = amount / price
             
-            if asset not in portfolio:
-                portfolio[asset] = {'shares': 0.0, 'avg_price': 0.0}
+                if asset not in portfolio:
+                    portfolio[asset] = {'shares': 0.0, 'avg_price': 0.0, 'value': 0.0}
             
-            # Weighted Avg Price
-            curr_shares = portfolio[asset]['shares']
-            curr_avg = portfolio[asset]['avg_price']
-            total_shares = curr_shares + shares_bought
+                # Weighted Avg Price
+                curr_shares = portfolio[asset]['shares']
+                curr_avg = portfolio[asset]['avg_price']
+                total_shares = curr_shares + shares_bought
             
-            new_avg = ((curr_shares * curr_avg) + (shares_bought * price)) / total_shares if total_shares > 0 else price
+                new_avg = ((curr_shares * curr_avg) + (shares_bought * price)) / total_shares if total_shares > 0 else price
             
-            portfolio[asset]['shares'] = total_shares
-            portfolio[asset]['avg_price'] = new_avg
+                portfolio[asset]['shares'] = total_shares
+                portfolio[asset]['avg_price'] = new_avg
+                portfolio[asset]['value'] = total_shares * new_avg
             
-            log_transaction("BUY", amount, asset, reasoning, price, 0.0)
-            logger.info(f"Executed BUY {asset}: ${amount:.2f} @ ${price}")
-        else:
-             logger.warning(f"Insufficient funds to BUY {asset}: ${amount} (Balance: ${current_balance})")
+                log_transaction("BUY", amount, asset, reasoning, price, 0.0)
+                logger.info(f"Executed BUY {asset}: ${amount:.2f} @ ${price}")
+            else:
+                 logger.warning(f"Insufficient funds to BUY {asset}: ${amount} (Balance: ${current_balance})")
             
-    elif action == "SELL":
-        if asset in portfolio:
-            # Check if we have enough value. 'amount' from Gemini is usually USD target to sell.
-            # Convert USD amount to shares
-            # We use the CURRENT execution price to determine how many shares to sell
-            shares_to_sell = amount / price
+        elif action == "SELL":
+            if asset in portfolio:
+                # Check if we have enough value. 'amount' from Gemini is usually USD target to sell.
+                # Convert USD amount to shares
+                # We use the CURRENT execution price to determine how many shares to sell
+                shares_to_sell = amount / price
             
-            if portfolio[asset]['shares'] >= shares_to_sell:
-                # Calculate Realized Gain/Loss %
-                # (Sell Price - Avg Buy Price) / Avg Buy Price
-                avg_buy_price = portfolio[asset]['avg_price']
-                if avg_buy_price > 0:
-                    gain_pct = ((price - avg_buy_price) / avg_buy_price) * 100
-                else:
-                    gain_pct = 0.0
+                if portfolio[asset]['shares'] >= shares_to_sell:
+                    # Calculate Realized Gain/Loss %
+                    # (Sell Price - Avg Buy Price) / Avg Buy Price
+                    avg_buy_price = portfolio[asset]['avg_price']
+                    if avg_buy_price > 0:
+                        gain_pct = ((price - avg_buy_price) / avg_buy_price) * 100
+                    else:
+                        gain_pct = 0.0
                 
-                current_balance += amount
-                portfolio[asset]['shares'] -= shares_to_sell
+                    current_balance += amount
+                    portfolio[asset]['shares'] -= shares_to_sell
+                    portfolio[asset]['value'] = portfolio[asset]['shares'] * avg_buy_price
+                    # Sold shares leave the cost basis at the average price
+                    _total_cost_basis -= shares_to_sell * avg_buy_price
                 
-                # Cleanup if empty
-                if portfolio[asset]['shares'] < 0.000001:
-                    del portfolio[asset]
+                    # Cleanup if empty
+                    if portfolio[asset]['shares'] < 0.000001:
+                        _total_cost_basis -= portfolio[asset]['shares'] * avg_buy_price
+                        del portfolio[asset]
+                        if not portfolio:
+                            _total_cost_basis = 0.0  # No rounding residue once flat
                     
-                log_transaction("SELL", amount, asset, reasoning, price, gain_pct)
-                logger.info(f"Executed SELL {asset}: ${amount} @ ${price} (Gain: {gain_pct:.2f}%)")
-            else:
-                 logger.warning(f"Insufficient shares to SELL {asset}. Request: {shares_to_sell}, Held: {portfolio[asset]['shares']}")
+                    log_transaction("SELL", amount, asset, reasoning, price, gain_pct)
+                    logger.info(f"Executed SELL {asset}: ${amount} @ ${price} (Gain: {gain_pct:.2f}%)")
+                else:
+                     logger.warning(f"Insufficient shares to SELL {asset}. Request: {shares_to_sell}, Held: {portfolio[asset]['shares']}")
 
-    elif action == "HOLD":
-        if asset in portfolio and portfolio[asset]['shares'] > 0:
-            log_transaction("HOLD", 0, asset, reasoning, price, 0.0)
-            logger.info(f"Holding position on {asset}. Reasoning: {reasoning}")
-        else:
-            log_transaction("WATCH", 0, asset, reasoning, price, 0.0)
-            logger.info(f"Watching {asset} (No position). Reasoning: {reasoning}")
+        elif action == "HOLD":
+            if asset in portfolio and portfolio[asset]['shares'] > 0:
+                log_transaction("HOLD", 0, asset, reasoning, price, 0.0)
+                logger.info(f"Holding position on {asset}. Reasoning: {reasoning}")
+            else:
+                log_transaction("WATCH", 0, asset, reasoning, price, 0.0)
+                logger.info(f"Watching {asset} (No position). Reasoning: {reasoning}")
     
-    elif action == "WATCH":
-        log_transaction("WATCH", 0, asset, reasoning, price, 0.0)
-        logger.info(f"Watching {asset}. Reasoning: {reasoning}")
+        elif action == "WATCH":
+            log_transaction("WATCH", 0, asset, reasoning, price, 0.0)
+            logger.info(f"Watching {asset}. Reasoning: {reasoning}")
 
-    # Calculate Total Portfolio Value using LATEST prices
-    # For assets not traded this turn, we ideally update their price.
-    # For now, we use the price from the transaction if available, or keep old estimate.
+        # Calculate Total Portfolio Value using LATEST prices
+        # For assets not traded this turn, we ideally update their price.
+        # For now, we use the price from the transaction if available, or keep old estimate.
     
-    # Simple Valuation: Cost Basis
-    total_holdings_val = sum(v['shares'] * v['avg_price'] for v in portfolio.values())
+        # Simple Valuation: Cost Basis
+        total_holdings_val = _total_cost_basis
     
-    # Simulate market fluctuation on the HOLDINGS only
-    # Cash (current_balance) does not fluctuate.
-    if total_holdings_val > 0:
-        import random
-        fluctuation = random.uniform(0.99, 1.01)
-        fluctuated_holdings = total_holdings_val * fluctuation
-    else:
-        fluctuated_holdings = 0.0
-
-    log_value = current_balance + fluctuated_holdings
+        # Simulate market fluctuation on the HOLDINGS only
+        # Cash (current_balance) does not fluctuate.
+        if total_holdings_val > 0:
+            # Uniform in [0.99, 1.01)
+            fluctuated_holdings = total_holdings_val * (1.0 + (random.random() - 0.5) * 0.02)
+        else:
+            fluctuated_holdings = 0.0
+
+        log_value = current_balance + fluctuated_holdings
     
-    log_portfolio_value(log_value)
+        # Idle turns only add noise to the chart (and rows to read back)
+        if _last_logged_value is None or abs(log_value - _last_logged_value) / max(log_value, 1.0) > HISTORY_MIN_CHANGE:
+            log_portfolio_value(log_value)
+            _last_logged_value = log_value
     logger.info(f"Estimated Portfolio Value: ${log_value:.2f}")
 
-# Schedule the job every 5 minutes
-schedule.every(5).minutes.do(investment_job)
+# /api/status and /api/history responses are reused for a few seconds.
+# Anything that changes the balance, portfolio or history drops them and bumps
+# _caches_generation, so a response computed from data read before that is
+# not stored over the invalidation.
+_STATUS_TTL = 3.0  # seconds
+_HISTORY_TTL = 15.0  # seconds
+_status_cache = {"t": 0, "val": None}
+_history_cache = {"t": 0, "val": None}
+_caches_generation = 0
+_caches_lock = threading.Lock()
+
+def _invalidate_caches():
+    global _caches_generation
+    with _caches_lock:
+        _caches_generation += 1
+        for cache in (_status_cache, _history_cache):
+            cache["t"] = 0
+            cache["val"] = None
+
+def _store_cached(cache, generation, val):
+    """Stores val in cache unless the caches were invalidated since generation was read."""
+    with _caches_lock:
+        if generation == _caches_generation:
+            cache.update(t=time.monotonic(), val=val)
 
 @app.get("/api/settings")
-def get_settings():
+async def get_settings():
     return trading_preferences
 
 @app.post("/api/settings")
@@ -204,21 +290,37 @@ def update_settings(prefs: dict):
     return {"status": "updated", "settings": trading_preferences}
 
 @app.get("/api/status")
-def get_status():
+async def get_status():
     """Returns current system status and balance."""
+    if _status_cache["val"] is not None and time.monotonic() - _status_cache["t"] < _STATUS_TTL:
+        return _status_cache["val"]
+    cache_generation = _caches_generation
+
     # Calculate holdings value from new structure
-    total_holdings = sum(v['shares'] * v['avg_price'] for v in portfolio.values())
+    total_holdings = _total_cost_basis
     total_value = current_balance + total_holdings
     
     # Calculate Net Performance (excluding deposits)
-    total_invested = get_total_deposited()
+    global _total_deposited_cache
+    with _deposits_lock:
+        total_invested = _total_deposited_cache
+        generation = _deposits_generation
+    current = True
+    if total_invested is None:
+        total_invested = await asyncio.to_thread(get_total_deposited)
+        with _deposits_lock:
+            # A deposit or reset during the query may be missing from its result.
+            # 0.0 is also what a failed query returns. Don't pin either.
+            current = generation == _deposits_generation
+            if current and total_invested > 0:
+                _total_deposited_cache = total_invested
     # Avoid division by zero
     performance_pct = ((total_value - total_invested) / total_invested * 100) if total_invested > 0 else 0.0
     
     # Flatten portfolio for frontend (Asset -> Value)
-    flat_portfolio = {k: v['shares'] * v['avg_price'] for k, v in portfolio.items()}
+    flat_portfolio = {k: v['value'] for k, v in portfolio.items()}
     
-    return {
+    status = {
         "balance": current_balance,
         "holdings": total_holdings,
         "total_value": total_value,
@@ -226,20 +328,31 @@ def get_status():
         "performance_pct": performance_pct,
         "portfolio": flat_portfolio
     }
+    if current:
+        _store_cached(_status_cache, cache_generation, status)
+    return status
 
 @app.get("/api/history")
-def get_history():
+async def get_history():
     """Returns historical portfolio value for charts."""
-    return get_portfolio_history()
+    if _history_cache["val"] is not None and time.monotonic() - _history_cache["t"] < _HISTORY_TTL:
+        return _history_cache["val"]
+    cache_generation = _caches_generation
+
+    history = await asyncio.to_thread(get_portfolio_history)
+    _store_cached(_history_cache, cache_generation, history)
+    return history
 
 @app.get("/api/transactions")
-def list_transactions():
+async def list_transactions():
     """Returns distinct actions taken by the bot."""
-    return get_transactions()
+    return await asyncio.to_thread(get_transactions)
 
 @app.post("/api/run")
 def run_analysis():
     """Trigger the investment analysis manually."""
+    if _job_lock.locked():
+        return JSONResponse(status_code=409, content={"status": "busy"})
     thread = threading.Thread(target=investment_job)
     thread.start()
     return {"status": "Analysis started"}
@@ -247,15 +360,19 @@ def run_analysis():
 @app.post("/api/reset")
 def reset_system():
     """Wipe database and reset to initial state."""
-    global current_balance, portfolio
+    global current_balance, portfolio, _total_cost_basis, _last_logged_value
     reset_db()
+    _update_total_deposited(None)
     
     # Re-initialize state (should be 100 on Deposit)
     c_bal, port = reconstruct_portfolio_state()
     current_balance = c_bal
     portfolio = port
+    _total_cost_basis = sum(v['value'] for v in portfolio.values())
     
     log_portfolio_value(current_balance) # Log initial state
+    _last_logged_value = current_balance
+    _invalidate_caches()
     logger.info("SYSTEM RESET: Database wiped and restarted.")
     
     return {"status": "Reset complete", "balance": current_balance}
@@ -265,7 +382,11 @@ def deposit_funds():
     global current_balance
     amount = 1000.0
     current_balance += amount
+    # Queued before the generation bump: a status load that starts after
+    # the bump flushes this row and sees it
     log_transaction("DEPOSIT", amount, "USD", "Test Deposit", 1.0, 0.0)
+    _update_total_deposited(amount)
+    _invalidate_caches()
     logger.info(f"Deposited ${amount}. New Balance: ${current_balance}")
     return {"status": "success", "new_balance": current_balance}
 
@@ -1,96 +1,128 @@
 import requests
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from jsonutil import parse_json
+
+# ijson's C backend parses events while the body is still arriving. Its
+# pure-Python backends are slower than parsing the whole body with orjson,
+# so streaming is only used with the C one.
+try:
+    import ijson
+    HAS_IJSON_C = ijson.backend == "yajl2_c"
+except ImportError:
+    HAS_IJSON_C = False
 
 logger = logging.getLogger(__name__)
 
 GAMMA_API_URL = "https://gamma-api.polymarket.com/events"
 
+# One pooled session so both feeds reuse keep-alive connections to the API.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+def _fetch_events(params, limit):
+    """GETs one page of active events from the Gamma API."""
+    # Common params
+    base_params = {
+        "closed": "false",
+        "limit": limit,
+        "active": "true" 
+    }
+    base_params.update(params)
+    
+    if HAS_IJSON_C:
+        with _SESSION.get(GAMMA_API_URL, params=base_params, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            # Let urllib3 undo gzip before ijson reads the raw stream
+            response.raw.decode_content = True
+            return list(ijson.items(response.raw, "item", use_float=True))
+
+    response = _SESSION.get(GAMMA_API_URL, params=base_params, timeout=10)
+    response.raise_for_status()
+    return parse_json(response.content)
+
+def _add_markets(events, market_data, tag_prefix=""):
+    """Adds the first open market of each event to market_data, keyed by slug."""
+    for event in events:
+        slug = event.get('slug')
+        # Deduplicate by slug before any other work; most short-term events
+        # were already added by the volume feed
+        if not slug or slug in market_data:
+            continue
+
+        title = event.get('title')
+        volume = float(event.get('volume', 0) or 0)
+        end_date_raw = event.get('endDate')
+        
+        # Format Date (ISO timestamps start with YYYY-MM-DD)
+        if isinstance(end_date_raw, str) and len(end_date_raw) >= 10:
+            end_date_str = end_date_raw[:10]
+        else:
+            end_date_str = str(end_date_raw) if end_date_raw else "Unknown"
+
+        markets = event.get('markets', [])
+        if not markets:
+            continue
+        
+        # Use the first market
+        main_market = markets[0]
+        if main_market.get('closed'):
+            continue
+
+        # Parse prices
+        try:
+            raw_prices = parse_json(main_market.get("outcomePrices", "[]"))
+            outcomes = parse_json(main_market.get("outcomes", "[]"))
+        except:
+            continue
+
+        if not raw_prices or not outcomes:
+            continue
+
+        # Format prices
+        price_list = []
+        for out, price in zip(outcomes, raw_prices):
+            price_list.append(f"{out}: {price}")
+        price_str = ", ".join(price_list)
+        
+        # Add tag if provided
+        display_title = f"{tag_prefix} {title}" if tag_prefix else title
+
+        market_data[slug] = {
+            "title": display_title,
+            "slug": slug,
+            "volume": volume,
+            "prices": price_str,
+            "deadline": end_date_str
+        }
+
 def get_top_markets(limit=10):
     """
     Fetches a mix of:
     1. Top active markets by volume.
     2. Markets ending soon (Short Term).
+    Both requests run at the same time; results are merged in that order,
+    so a market in both lists keeps its high-volume entry.
     """
     market_data = {}
+    feeds = [
+        # 1. High Volume
+        ({"order": "volume", "ascending": "false"}, ""),
+        # 2. Closing Soon (Short Term)
+        # sorting by endDate ascending gives soonest expiring
+        ({"order": "endDate", "ascending": "true"}, "[Short Term]"),
+    ]
 
-    def fetch_markets(params, tag_prefix=""):
+    with ThreadPoolExecutor(max_workers=len(feeds)) as executor:
+        futures = [executor.submit(_fetch_events, params, limit) for params, _ in feeds]
+
+    for (params, tag_prefix), future in zip(feeds, futures):
         try:
-            # Common params
-            base_params = {
-                "closed": "false",
-                "limit": limit,
-                "active": "true" 
-            }
-            base_params.update(params)
-            
-            response = requests.get(GAMMA_API_URL, params=base_params, timeout=10)
-            response.raise_for_status()
-            events = response.json()
-
-            for event in events:
-                title = event.get('title')
-                slug = event.get('slug')
-                volume = float(event.get('volume', 0) or 0)
-                end_date_raw = event.get('endDate')
-                
-                # Format Date
-                end_date_str = "Unknown"
-                if end_date_raw:
-                    try:
-                        # Simple truncation or parsing
-                        end_date_str = end_date_raw.split('T')[0]
-                    except:
-                        end_date_str = str(end_date_raw)
-
-                # Deduplicate by slug immediately
-                if slug in market_data:
-                    continue
-
-                markets = event.get('markets', [])
-                if not markets:
-                    continue
-                
-                # Use the first market
-                main_market = markets[0]
-                if main_market.get('closed'):
-                    continue
-
-                # Parse prices
-                try:
-                    raw_prices = json.loads(main_market.get("outcomePrices", "[]"))
-                    outcomes = json.loads(main_market.get("outcomes", "[]"))
-                except:
-                    continue
-
-                if not raw_prices or not outcomes:
-                    continue
-
-                # Format prices
-                price_list = []
-                for out, price in zip(outcomes, raw_prices):
-                    price_list.append(f"{out}: {price}")
-                price_str = ", ".join(price_list)
-                
-                # Add tag if provided
-                display_title = f"{tag_prefix} {title}" if tag_prefix else title
-
-                market_data[slug] = {
-                    "title": display_title,
-                    "slug": slug,
-                    "volume": volume,
-                    "prices": price_str,
-                    "deadline": end_date_str
-                }
+            _add_markets(future.result(), market_data, tag_prefix)
         except Exception as e:
             logger.error(f"Error fetching Polymarket data with params {params}: {e}")
-
-    # 1. Fetch High Volume
-    fetch_markets({"order": "volume", "ascending": "false"})
-
-    # 2. Fetch Closing Soon (Short Term)
-    # sorting by endDate ascending gives soonest expiring
-    fetch_markets({"order": "endDate", "ascending": "true"}, tag_prefix="[Short Term]")
     
     return list(market_data.values())
 
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import pandas as pd
+import yfinance as yf
+
+logger = logging.getLogger(__name__)
+
+# Quotes are reused for QUOTE_TTL seconds per symbol list, in memory and in a
+# small SQLite file so a restarted backend starts warm.
+QUOTE_TTL = 45
+QUOTE_CACHE_DB = os.getenv("QUOTE_CACHE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quote_cache.db"))
+_MEMORY_CACHE_SIZE = 256
+
+_memory_cache = {}  # key -> (fetched_at, quotes)
+_cache_lock = threading.Lock()
+_cache_db = None  # opened on first use and shared by every thread, under _cache_lock
+
+def _cache_conn():
+    """Returns the shared cache connection, creating the table once. Call with _cache_lock held."""
+    global _cache_db
+    if _cache_db is None:
+        conn = sqlite3.connect(QUOTE_CACHE_DB, timeout=5, check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS quote_cache (key TEXT PRIMARY KEY, payload TEXT, ts REAL)")
+        _cache_db = conn
+    return _cache_db
+
+def _load_cached(key):
+    try:
+        with _cache_lock:
+            row = _cache_conn().execute("SELECT ts, payload FROM quote_cache WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        logger.warning(f"Quote cache read failed: {e}")
+        return None
+    if not row:
+        return None
+    return row[0], {symbol: tuple(q) for symbol, q in json.loads(row[1]).items()}
+
+def _store_cached(key, fetched_at, quotes):
+    try:
+        with _cache_lock, _cache_conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO quote_cache (key, payload, ts) VALUES (?, ?, ?)",
+                         (key, json.dumps(quotes), fetched_at))
+            # Rotating stock selections create many keys; keep only the last day.
+            conn.execute("DELETE FROM quote_cache WHERE ts < ?", (fetched_at - 86400,))
+    except sqlite3.Error as e:
+        logger.warning(f"Quote cache write failed: {e}")
+
+def get_quotes(symbols, ttl=QUOTE_TTL):
+    """
+    Returns {symbol: (last_price, previous_close)} for the symbols, reusing a
+    cached result for the same symbol list when it is less than ttl seconds old.
+    """
+    if not symbols:
+        return {}
+
+    key = ",".join(sorted(symbols))
+    now = time.time()
+    with _cache_lock:
+        hit = _memory_cache.get(key)
+    if hit is None:
+        hit = _load_cached(key)
+    if hit is not None and now - hit[0] < ttl:
+        with _cache_lock:
+            _memory_cache[key] = hit
+        return hit[1]
+
+    quotes = _download_quotes(symbols)
+    if quotes:
+        with _cache_lock:
+            _memory_cache[key] = (now, quotes)
+            if len(_memory_cache) > _MEMORY_CACHE_SIZE:
+                # Drop the oldest entry
+                del _memory_cache[min(_memory_cache, key=lambda k: _memory_cache[k][0])]
+        _store_cached(key, now, quotes)
+    return quotes
+
+def _download_quotes(symbols):
+    """
+    Fetches the latest price and previous close for every symbol with one
+    batched yfinance download (instead of one fast_info request per ticker).
+    Returns {symbol: (last_price, previous_close)}; symbols without data are left out.
+    """
+    data = yf.download(
+        tickers=" ".join(symbols),
+        period="5d",
+        interval="1d",
+        group_by="ticker",
+        auto_adjust=False,
+        threads=True,
+        progress=False
+    )
+
+    quotes = {}
+    for symbol in symbols:
+        try:
+            frame = data[symbol] if isinstance(data.columns, pd.MultiIndex) else data
+            closes = frame["Close"].dropna()
+            if closes.empty:
+                continue
+            prev_close = float(closes.iloc[-2]) if len(closes) > 1 else None
+            quotes[symbol] = (float(closes.iloc[-1]), prev_close)
+        except KeyError:
+            logger.warning(f"No quote data for {symbol}")
+    return quotes
+
+if __name__ == "__main__":
+    # Test run
+    print(get_quotes(["NVDA", "BTC-USD"]))
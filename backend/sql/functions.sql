@@ -0,0 +1,130 @@
+-- Server-side helpers called from db.py via supabase.rpc(), plus the indexes
+-- its queries use. Run this in the Supabase SQL editor. Every statement is
+-- idempotent, so the whole file can be re-applied after edits. db.py falls
+-- back to client-side computation when a function is missing.
+
+-- get_portfolio_history orders the whole table by timestamp, get_transactions
+-- reads the 50 newest rows by timestamp, and the deposit total filters on
+-- category. Without these each of them is a sequential scan plus a sort.
+create index if not exists portfolio_history_timestamp_idx on portfolio_history (timestamp);
+create index if not exists transactions_timestamp_idx on transactions (timestamp);
+create index if not exists transactions_category_idx on transactions (category);
+
+-- Sum of all deposits, returned as a single scalar.
+create or replace function get_total_deposited()
+returns double precision
+language sql
+stable
+as $$
+    select coalesce(sum(amount), 0)::double precision
+    from transactions
+    where category = 'DEPOSIT';
+$$;
+
+-- Rebuilds the portfolio from the transaction log and returns
+-- {"balance": <float>, "portfolio": {"<asset>": {"shares": <float>, "avg_price": <float>}}}.
+-- Mirrors db._apply_transaction: prices that are missing or
+-- <= 0 count as 1.0, BUYs update the weighted average price, SELLs reduce
+-- shares and drop positions below 0.000001 shares. BUYs without an asset
+-- only move the balance (jsonb keys can't be null).
+-- The balance and every position that was never sold are plain
+-- aggregates. Positions with SELLs are still folded row by row: a sell keeps
+-- the average price and a full exit restarts it, which a GROUP BY can't express.
+create or replace function reconstruct_portfolio_state()
+returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    tx record;
+    curr_shares double precision;
+    curr_avg double precision;
+    total_shares double precision;
+    remaining double precision;
+    balance double precision;
+    portfolio jsonb;
+begin
+    select
+        coalesce(sum(case category
+            when 'DEPOSIT' then coalesce(amount::double precision, 0)
+            when 'BUY' then -coalesce(amount::double precision, 0)
+            when 'SELL' then coalesce(amount::double precision, 0)
+            else 0
+        end), 0)
+    into balance
+    from transactions;
+
+    -- Never sold: the weighted average is total cost over total shares
+    select coalesce(jsonb_object_agg(b.asset, jsonb_build_object(
+        'shares', b.shares,
+        'avg_price', case when b.shares > 0 then b.cost / b.shares else b.last_px end
+    )), '{}'::jsonb)
+    into portfolio
+    from (
+        select p.asset, sum(p.amt / p.px) as shares, sum(p.amt) as cost,
+               (array_agg(p.px order by p.id desc))[1] as last_px
+        from (
+            select id, asset, coalesce(amount::double precision, 0) as amt,
+                   case when coalesce(price::double precision, 1.0) <= 0 then 1.0
+                        else coalesce(price::double precision, 1.0) end as px
+            from transactions
+            where category = 'BUY' and asset is not null
+        ) p
+        where not exists (
+            select 1 from transactions s where s.category = 'SELL' and s.asset = p.asset
+        )
+        group by p.asset
+    ) b;
+
+    for tx in
+        select t.category, t.asset,
+               coalesce(t.amount::double precision, 0) as amt,
+               case when coalesce(t.price::double precision, 1.0) <= 0 then 1.0
+                    else coalesce(t.price::double precision, 1.0) end as px
+        from transactions t
+        where t.category in ('BUY', 'SELL')
+          and exists (select 1 from transactions s where s.category = 'SELL' and s.asset = t.asset)
+        order by t.id
+    loop
+        if tx.category = 'BUY' then
+            curr_shares := coalesce((portfolio -> tx.asset ->> 'shares')::double precision, 0);
+            curr_avg := coalesce((portfolio -> tx.asset ->> 'avg_price')::double precision, 0);
+            total_shares := curr_shares + tx.amt / tx.px;
+            portfolio := portfolio || jsonb_build_object(tx.asset, jsonb_build_object(
+                'shares', total_shares,
+                'avg_price', case
+                    when total_shares > 0 then (curr_shares * curr_avg + tx.amt) / total_shares
+                    else tx.px
+                end
+            ));
+        elsif portfolio ? tx.asset then
+            remaining := greatest(0, (portfolio -> tx.asset ->> 'shares')::double precision - tx.amt / tx.px);
+            if remaining < 0.000001 then
+                portfolio := portfolio - tx.asset;
+            else
+                portfolio := jsonb_set(portfolio, array[tx.asset, 'shares'], to_jsonb(remaining));
+            end if;
+        end if;
+    end loop;
+
+    return jsonb_build_object('balance', balance, 'portfolio', portfolio);
+end;
+$$;
+
+-- Empties both tables in one statement and restarts their id sequences.
+-- security definer: TRUNCATE ... RESTART IDENTITY needs owner rights on the
+-- tables and sequences, which the API role does not have. Because it bypasses
+-- row-level security, only the backend's service_role may call it; functions
+-- are executable by PUBLIC by default, which would let anyone with the anon
+-- key wipe both tables.
+create or replace function reset_tables()
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    truncate transactions, portfolio_history restart identity;
+$$;
+
+revoke execute on function reset_tables() from public, anon, authenticated;
+grant execute on function reset_tables() to service_role;
@@ -3,13 +3,12 @@ import yfinance as yf
 print("Testing yfinance...")
 
 stocks = ["NVDA", "BTC-USD"]
-tickers = yf.Tickers(" ".join(stocks))
+# One threaded download for every symbol instead of a request per ticker
+data = yf.download(stocks, period="1d", interval="1m", group_by="ticker", threads=True, progress=False)
 
 for symbol in stocks:
     try:
-        # Try both fast_info and history to see what works
-        info = tickers.tickers[symbol].fast_info
-        price = info.last_price
+        price = float(data[symbol]["Close"].dropna().iloc[-1])
         print(f"SUCCESS: {symbol} price is {price}")
     except Exception as e:
         print(f"FAILED: {symbol} - {e}")